@@ -1,25 +1,256 @@
 import asyncio
 import os
+import random
 import sys
+import threading
+import time
+from importlib import resources
 
 import aiohttp
+import onnxruntime
 from dotenv import load_dotenv
 from loguru import logger
 from runner import configure
 
-from pipecat.audio.vad.silero import SileroVADAnalyzer
-from pipecat.frames.frames import TTSSpeakFrame
+from pipecat.audio.vad.silero import SileroOnnxModel, SileroVADAnalyzer
+from pipecat.audio.vad.vad_analyzer import VADAnalyzer, VADParams
+from pipecat.frames.frames import (
+    CancelFrame,
+    EndFrame,
+    Frame,
+    FunctionCallResultFrame,
+    LLMFullResponseEndFrame,
+    LLMTextFrame,
+    StartFrame,
+    StartInterruptionFrame,
+    SystemFrame,
+    TextFrame,
+    TTSSpeakFrame,
+)
 from pipecat.pipeline.pipeline import Pipeline
 from pipecat.pipeline.runner import PipelineRunner
 from pipecat.pipeline.task import PipelineParams, PipelineTask
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
 from pipecat.services.cartesia import CartesiaTTSService
 from pipecat.services.openai import OpenAILLMContext, OpenAILLMService, OpenAILLMContextFrame
 from pipecat.transports.services.daily import DailyParams, DailyTransport
+from pipecat.utils.string import match_endofsentence
 
 load_dotenv(override=True)
 
-logger.remove(0)
-logger.add(sys.stderr, level="DEBUG")
+# Keep the placeholder delays in the stub call-control handlers (demo only)
+SIMULATE_DELAYS = os.getenv("SIMULATE_DELAYS", "0") == "1"
+
+# Staff the receptionist can put callers through to
+STAFF = ["John Doe", "Jane Smith", "Bob Johnson", "Alice Brown"]
+
+# How often staff availability is refreshed, in seconds
+AVAILABILITY_REFRESH_SECS = 30
+
+# Latest known availability: {casefolded name: (is_available, checked_at)}
+AVAILABILITY_CACHE: dict[str, tuple[bool, float]] = {}
+
+# Background task keeping AVAILABILITY_CACHE fresh, shared by all bots
+_availability_refresher = None
+
+# Silero VAD ONNX session shared by every bot in the process
+_VAD_SESSION = None
+_VAD_SESSION_LOCK = threading.Lock()
+
+# Minimum number of words buffered before a comma is treated as a chunk boundary
+MIN_WORDS_BEFORE_COMMA = 4
+
+# How long TTSSpeakFrames are held so back-to-back ones can be merged, in seconds
+TTS_COALESCE_SECS = 0.05
+
+
+def get_vad_session() -> onnxruntime.InferenceSession:
+    """Return the shared Silero VAD session, loading the model on first use."""
+    global _VAD_SESSION
+    with _VAD_SESSION_LOCK:
+        if _VAD_SESSION is None:
+            opts = onnxruntime.SessionOptions()
+            # One thread per inference so concurrent calls don't contend
+            opts.inter_op_num_threads = 1
+            opts.intra_op_num_threads = 1
+            # SILERO_VAD_MODEL can point at an alternative build of the model,
+            # e.g. a quantized one, that has been validated offline
+            model_path = os.getenv("SILERO_VAD_MODEL") or resources.files(
+                "pipecat.audio.vad.data"
+            ).joinpath("silero_vad.onnx")
+            logger.debug(f"Loading shared Silero VAD session from {model_path}")
+            _VAD_SESSION = onnxruntime.InferenceSession(
+                str(model_path), providers=["CPUExecutionProvider"], sess_options=opts
+            )
+        return _VAD_SESSION
+
+
+class SharedSileroOnnxModel(SileroOnnxModel):
+    """Silero model with its own RNN state on top of an existing ONNX session."""
+
+    def __init__(self, session: onnxruntime.InferenceSession):
+        self.session = session
+        self.reset_states()
+        self.sample_rates = [8000, 16000]
+
+
+class SharedSileroVADAnalyzer(SileroVADAnalyzer):
+    """Silero VAD analyzer that runs on the process-wide ONNX session.
+
+    Only the per-call state lives in each analyzer; the model weights and
+    ONNX Runtime arena are loaded once and shared by every bot.
+    """
+
+    def __init__(self, *, sample_rate=None, params: VADParams = VADParams()):
+        # Skip SileroVADAnalyzer.__init__, which loads a private copy of the model
+        VADAnalyzer.__init__(self, sample_rate=sample_rate, params=params)
+        self._model = SharedSileroOnnxModel(get_vad_session())
+        self._last_reset_time = 0
+
+
+class SentenceChunker(FrameProcessor):
+    """Forward LLM tokens to TTS in sentence-sized chunks.
+
+    Text is flushed on sentence-ending punctuation, or on a comma once at least
+    MIN_WORDS_BEFORE_COMMA words are buffered, so synthesis of the first clause
+    starts while the LLM is still generating the rest of the response.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._buf = ""
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, LLMTextFrame):
+            self._buf += frame.text
+            if match_endofsentence(self._buf) or (
+                self._buf.rstrip().endswith(",")
+                and len(self._buf.split()) >= MIN_WORDS_BEFORE_COMMA
+            ):
+                await self._flush()
+        elif isinstance(frame, (LLMFullResponseEndFrame, EndFrame)):
+            await self._flush()
+            await self.push_frame(frame, direction)
+        elif isinstance(frame, StartInterruptionFrame):
+            self._buf = ""
+            await self.push_frame(frame, direction)
+        else:
+            await self.push_frame(frame, direction)
+
+    async def _flush(self):
+        if self._buf:
+            await self.push_frame(TextFrame(self._buf))
+            self._buf = ""
+
+
+class TTSCoalescer(FrameProcessor):
+    """Merge TTSSpeakFrames that arrive within TTS_COALESCE_SECS of each other.
+
+    Function call start callbacks each push their own TTSSpeakFrame; sending
+    them to the TTS service as one request saves a round trip per message.
+    The function call frames pushed between those callbacks (system frames and
+    FunctionCallResultFrame) pass straight through. Any other downstream frame
+    flushes what is held first, so speech stays ordered with LLM output.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._texts = []
+        self._held = asyncio.Event()
+        self._flushed = asyncio.Event()
+        self._flush_task = None
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, StartFrame):
+            await self.push_frame(frame, direction)
+            if not self._flush_task:
+                self._flush_task = self.create_task(self._flush_task_handler())
+        elif isinstance(frame, TTSSpeakFrame):
+            self._texts.append(frame.text)
+            if not self._held.is_set():
+                self._flushed.clear()
+                self._held.set()
+        elif isinstance(frame, (StartInterruptionFrame, CancelFrame)):
+            self._texts = []
+            self._release()
+            if isinstance(frame, CancelFrame):
+                await self._cancel_flush_task()
+            await self.push_frame(frame, direction)
+        elif isinstance(frame, (SystemFrame, FunctionCallResultFrame)):
+            await self.push_frame(frame, direction)
+        else:
+            if direction == FrameDirection.DOWNSTREAM:
+                await self._flush()
+            if isinstance(frame, EndFrame):
+                await self._cancel_flush_task()
+            await self.push_frame(frame, direction)
+
+    async def _flush_task_handler(self):
+        while True:
+            await self._held.wait()
+            try:
+                # Another frame may flush first, which ends the window early
+                await asyncio.wait_for(self._flushed.wait(), TTS_COALESCE_SECS)
+            except asyncio.TimeoutError:
+                await self._flush()
+
+    async def _cancel_flush_task(self):
+        if self._flush_task:
+            await self.cancel_task(self._flush_task)
+            self._flush_task = None
+
+    def _release(self):
+        self._held.clear()
+        self._flushed.set()
+
+    async def _flush(self):
+        self._release()
+        if self._texts:
+            text = " ".join(self._texts)
+            self._texts = []
+            await self.push_frame(TTSSpeakFrame(text))
+
+
+async def lookup_availability(person_name: str) -> bool:
+    """Look up whether a staff member is available to take a call."""
+    # Simulate a directory lookup - randomly determine if available
+    return random.choice([True, False])
+
+
+async def _refresh_availability():
+    """Poll availability for all staff into AVAILABILITY_CACHE."""
+    while True:
+        for name in STAFF:
+            try:
+                is_available = await lookup_availability(name)
+                AVAILABILITY_CACHE[name.casefold()] = (is_available, time.time())
+            except Exception as e:
+                logger.error(f"Failed to refresh availability for {name}: {e}")
+        await asyncio.sleep(AVAILABILITY_REFRESH_SECS)
+
+
+def start_availability_refresher():
+    """Start the availability poller unless it is already running.
+
+    Called once per process by its owner (the server lifespan or the script
+    entry point), not by individual bots.
+    """
+    global _availability_refresher
+    if _availability_refresher is None or _availability_refresher.done():
+        _availability_refresher = asyncio.create_task(_refresh_availability())
+
+
+async def stop_availability_refresher():
+    """Stop the availability poller and wait for it to exit."""
+    global _availability_refresher
+    if _availability_refresher is not None:
+        _availability_refresher.cancel()
+        await asyncio.gather(_availability_refresher, return_exceptions=True)
+        _availability_refresher = None
 
 
 async def start_put_on_hold(function_name, llm, context):
@@ -29,7 +260,8 @@ async def start_put_on_hold(function_name, llm, context):
 
 async def put_caller_on_hold(function_name, tool_call_id, args, llm, context, result_callback):
     # Simulate a brief hold period
-    await asyncio.sleep(2)
+    if SIMULATE_DELAYS:
+        await asyncio.sleep(2)
     await result_callback({"status": "on_hold", "message": "Caller has been put on hold"})
 
 async def start_check_availability(function_name, llm, context):
@@ -39,10 +271,7 @@ async def start_check_availability(function_name, llm, context):
 
 async def check_person_availability(function_name, tool_call_id, args, llm, context, result_callback):
     person_name = args.get("person_name", "")
-    # Simulate checking availability - randomly determine if available
-    import random
-    is_available = random.choice([True, False])
-    await asyncio.sleep(2)  # Simulate a delay for checking
+    is_available = AVAILABILITY_CACHE.get(person_name.strip().casefold(), (False, 0))[0]
     await result_callback({"is_available": is_available, "person_name": person_name})
 
 async def start_transfer_call(function_name, llm, context):
@@ -53,7 +282,8 @@ async def start_transfer_call(function_name, llm, context):
 async def transfer_call(function_name, tool_call_id, args, llm, context, result_callback):
     person_name = args.get("person_name", "")
     # Simulate transferring the call
-    await asyncio.sleep(3)
+    if SIMULATE_DELAYS:
+        await asyncio.sleep(3)
     await result_callback({"status": "transferred", "person_name": person_name})
 
 async def start_take_message(function_name, llm, context):
@@ -65,15 +295,13 @@ async def take_message(function_name, tool_call_id, args, llm, context, result_c
     person_name = args.get("person_name", "")
     message = args.get("message", "")
     # Simulate recording a message
-    await asyncio.sleep(1)
+    if SIMULATE_DELAYS:
+        await asyncio.sleep(1)
     await result_callback({"status": "message_recorded", "person_name": person_name})
 
-class ReceptionistProcessor:
-    def __init__(self, context: OpenAILLMContext):
-        context.add_message(
-            {
-                "role": "system",
-                "content": """You are a helpful receptionist for a legal company. Your job is to:
+_SYSTEM_MSG = {
+    "role": "system",
+    "content": """You are a helpful receptionist for a legal company. Your job is to:
                 1. Greet callers and ask who they would like to speak with. 
                 The available people are:
                 - John Doe
@@ -92,146 +320,183 @@ class ReceptionistProcessor:
                 If the person is not available, use the take_message function.
                 
                 Your output will be converted to audio so don't include special characters in your answers.""",
-            }
-        )
-        context.set_tools(
-            [
-                {
-                    "type": "function",
-                    "function": {
-                        "name": "put_caller_on_hold",
-                        "description": "Put the caller on hold while checking for the requested person",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {},
-                        },
+}
+
+_TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "put_caller_on_hold",
+            "description": "Put the caller on hold while checking for the requested person",
+            "parameters": {
+                "type": "object",
+                "properties": {},
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "check_person_availability",
+            "description": "Check if a person is available to take the call",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "person_name": {
+                        "type": "string",
+                        "description": "The name of the person to check availability for",
                     },
                 },
-                {
-                    "type": "function",
-                    "function": {
-                        "name": "check_person_availability",
-                        "description": "Check if a person is available to take the call",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "person_name": {
-                                    "type": "string",
-                                    "description": "The name of the person to check availability for",
-                                },
-                            },
-                            "required": ["person_name"],
-                        },
+                "required": ["person_name"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "transfer_call",
+            "description": "Transfer the call to the requested person",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "person_name": {
+                        "type": "string",
+                        "description": "The name of the person to transfer the call to",
                     },
                 },
-                {
-                    "type": "function",
-                    "function": {
-                        "name": "transfer_call",
-                        "description": "Transfer the call to the requested person",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "person_name": {
-                                    "type": "string",
-                                    "description": "The name of the person to transfer the call to",
-                                },
-                            },
-                            "required": ["person_name"],
-                        },
+                "required": ["person_name"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "take_message",
+            "description": "Take a message for the unavailable person",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "person_name": {
+                        "type": "string",
+                        "description": "The name of the person to take a message for",
                     },
-                },
-                {
-                    "type": "function",
-                    "function": {
-                        "name": "take_message",
-                        "description": "Take a message for the unavailable person",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "person_name": {
-                                    "type": "string",
-                                    "description": "The name of the person to take a message for",
-                                },
-                                "message": {
-                                    "type": "string",
-                                    "description": "The message to be recorded",
-                                },
-                            },
-                            "required": ["person_name", "message"],
-                        },
+                    "message": {
+                        "type": "string",
+                        "description": "The message to be recorded",
                     },
                 },
-            ]
-        )
-
-async def main():
-    async with aiohttp.ClientSession() as session:
-        (room_url, token) = await configure(session)
-
-        transport = DailyTransport(
-            room_url,
-            token,
-            "Receptionist Bot",
-            DailyParams(
-                audio_out_enabled=True,
-                transcription_enabled=True,
-                vad_enabled=True,
-                vad_analyzer=SileroVADAnalyzer(),
-            ),
-        )
-
-        tts = CartesiaTTSService(
-            api_key=os.getenv("CARTESIA_API_KEY"),
-            voice_id="79a125e8-cd45-4c13-8a67-188112f4dd22",  # British Lady
-        )
-
-        llm = OpenAILLMService(api_key=os.getenv("OPENAI_API_KEY"), model="gpt-4o")
-        
-        messages = []
-        context = OpenAILLMContext(messages=messages)
-        context_aggregator = llm.create_context_aggregator(context)
-        
-        # Initialize the receptionist processor
-        receptionist = ReceptionistProcessor(context)
-        
-        # Register the receptionist functions
-        llm.register_function("put_caller_on_hold", put_caller_on_hold, start_callback=start_put_on_hold)
-        llm.register_function("check_person_availability", check_person_availability, start_callback=start_check_availability)
-        llm.register_function("transfer_call", transfer_call, start_callback=start_transfer_call)
-        llm.register_function("take_message", take_message, start_callback=start_take_message)
-
-        pipeline = Pipeline(
-            [
-                transport.input(),
-                context_aggregator.user(),
-                llm,
-                tts,
-                transport.output(),
-                context_aggregator.assistant(),
-            ]
-        )
-
-        task = PipelineTask(
-            pipeline,
-            params=PipelineParams(
-                allow_interruptions=True,
-                enable_metrics=True,
-                enable_usage_metrics=True,
-                report_only_initial_ttfb=True,
-            ),
-        )
-
-        @transport.event_handler("on_first_participant_joined")
-        async def on_first_participant_joined(transport, participant):
-            await transport.capture_participant_transcription(participant["id"])
-            # Kick off the conversation.
-            await task.queue_frames([OpenAILLMContextFrame(context)])
-
-        runner = PipelineRunner()
-
-        await runner.run(task)
+                "required": ["person_name", "message"],
+            },
+        },
+    },
+]
+
+
+class ReceptionistProcessor:
+    def __init__(self, context: OpenAILLMContext):
+        # Copy the system message so no context can mutate the shared constant
+        context.add_message(dict(_SYSTEM_MSG))
+        context.set_tools(_TOOLS)
+
+async def main(
+    room_url: str,
+    token: str,
+    pathname=None,
+    user_id=None,
+    marketing=None,
+    handle_sigint: bool = True,
+):
+    """Run a receptionist bot in the given Daily room until the pipeline ends.
+
+    Called in-process by the server for each new call, or from the command
+    line via configure().
+    """
+    logger.info(f"Starting bot - room: {room_url}, pathname: {pathname}, user_id: {user_id}, marketing: {marketing}")
+
+    transport = DailyTransport(
+        room_url,
+        token,
+        "Receptionist Bot",
+        DailyParams(
+            audio_out_enabled=True,
+            transcription_enabled=True,
+            vad_enabled=True,
+            vad_analyzer=SharedSileroVADAnalyzer(),
+        ),
+    )
+
+    tts = CartesiaTTSService(
+        api_key=os.getenv("CARTESIA_API_KEY"),
+        voice_id="79a125e8-cd45-4c13-8a67-188112f4dd22",  # British Lady
+    )
+    # SentenceChunker decides where chunks end, so speak each one as it arrives.
+    # Sending a chunk only writes it to the Cartesia websocket; all chunks of a
+    # response share one audio context, so they are synthesized while earlier
+    # audio is still playing and come back in order.
+    tts._aggregate_sentences = False
+
+    llm = OpenAILLMService(api_key=os.getenv("OPENAI_API_KEY"), model="gpt-4o")
+    
+    messages = []
+    context = OpenAILLMContext(messages=messages)
+    context_aggregator = llm.create_context_aggregator(context)
+    
+    # Initialize the receptionist processor
+    receptionist = ReceptionistProcessor(context)
+    
+    # Register the receptionist functions
+    llm.register_function("put_caller_on_hold", put_caller_on_hold, start_callback=start_put_on_hold)
+    llm.register_function("check_person_availability", check_person_availability, start_callback=start_check_availability)
+    llm.register_function("transfer_call", transfer_call, start_callback=start_transfer_call)
+    llm.register_function("take_message", take_message, start_callback=start_take_message)
+
+    pipeline = Pipeline(
+        [
+            transport.input(),
+            context_aggregator.user(),
+            llm,
+            SentenceChunker(),
+            TTSCoalescer(),
+            tts,
+            transport.output(),
+            context_aggregator.assistant(),
+        ]
+    )
+
+    task = PipelineTask(
+        pipeline,
+        params=PipelineParams(
+            allow_interruptions=True,
+            enable_metrics=True,
+            enable_usage_metrics=True,
+            report_only_initial_ttfb=True,
+        ),
+    )
+
+    @transport.event_handler("on_first_participant_joined")
+    async def on_first_participant_joined(transport, participant):
+        await transport.capture_participant_transcription(participant["id"])
+        # Kick off the conversation.
+        await task.queue_frames([OpenAILLMContextFrame(context)])
+
+    # The server passes handle_sigint=False since it owns signal handling
+    # when bots run inside its event loop
+    runner = PipelineRunner(handle_sigint=handle_sigint)
+
+    await runner.run(task)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    logger.remove(0)
+    logger.add(sys.stderr, level="DEBUG")
+
+    async def run():
+        async with aiohttp.ClientSession() as session:
+            (room_url, token) = await configure(session)
+        start_availability_refresher()
+        try:
+            await main(room_url, token)
+        finally:
+            await stop_availability_refresher()
+
+    asyncio.run(run())
\ No newline at end of file
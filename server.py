@@ -3,7 +3,7 @@
 This FastAPI server manages RTVI bot instances and provides endpoints for both
 direct browser access and RTVI client connections. It handles:
 - Creating Daily rooms
-- Managing bot processes
+- Running bot instances as asyncio tasks
 - Providing connection credentials
 - Monitoring bot status
 
@@ -15,72 +15,194 @@ Requirements:
 """
 
 import argparse
+import asyncio
+import functools
 import os
-import subprocess
 import time
+from collections import OrderedDict, defaultdict
 from contextlib import asynccontextmanager
 from typing import Any, Dict, Tuple
 
 import aiohttp
+import orjson
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.responses import ORJSONResponse, RedirectResponse
 import sys
 from loguru import logger
 
 from pipecat.transports.services.helpers.daily_rest import DailyRESTHelper, DailyRoomParams
 
+# Imported up front so pipecat, Silero and the service clients are loaded once
+# at server startup rather than when the first bot starts
+import bot
+
 # Load environment variables from .env file
 load_dotenv(override=True)
 
 # Configure logger
 logger.remove()  # Remove default handler
-logger.add(sys.stdout, level="INFO")  # Add stdout handler with INFO level
-logger.add("server.log", rotation="500 MB", level="DEBUG")  # Also log to file with rotation
+# Bots log through these sinks too; tag each record with the bot it came from
+LOG_FORMAT = (
+    "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | "
+    "bot={extra[bot_id]} | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - "
+    "<level>{message}</level>"
+)
+logger.configure(extra={"bot_id": "-"})
+# Sinks are enqueued so log writes happen on a worker thread, not the event loop
+logger.add(sys.stdout, level="INFO", format=LOG_FORMAT, enqueue=True)  # Add stdout handler with INFO level
+logger.add("server.log", rotation="500 MB", level="DEBUG", format=LOG_FORMAT, enqueue=True)  # Also log to file with rotation
 
 # Maximum number of bot instances allowed per room
 MAX_BOTS_PER_ROOM = 1
 
-# Dictionary to track bot processes: {pid: (process, room_url)}
+# Number of ready-to-use rooms kept warm; 0 disables the pool
+ROOM_POOL_SIZE = int(os.getenv("ROOM_POOL_SIZE", "5"))
+
+# Refill the pool once it drops below this many rooms
+ROOM_POOL_REFILL_AT = 2
+
+# Seconds to let an in-flight refill finish at shutdown before cancelling it
+ROOM_POOL_SHUTDOWN_TIMEOUT = 5
+
+# Seconds a cached Daily token is reused for (tokens are issued for 1 hour)
+TOKEN_CACHE_TTL = 3000
+
+# Maximum number of rooms with a cached token
+TOKEN_CACHE_MAXLEN = 256
+
+# LRU cache of Daily tokens: {room_url: (token, expires_at)}
+_token_cache: OrderedDict = OrderedDict()
+
+# Pre-created room URLs, with their tokens in _token_cache
+room_pool: asyncio.Queue = asyncio.Queue()
+
+# Background task currently refilling room_pool
+room_pool_refill = None
+
+# Seconds to wait for cancelled bots to finish during server shutdown
+BOT_SHUTDOWN_TIMEOUT = 5
+
+# How often finished bots are pruned from bot_procs, in seconds
+BOT_SWEEP_INTERVAL = 30
+
+# Dictionary to track bot tasks: {bot_id: (task, room_url)}
 bot_procs = {}
 
+# Running bots per room: {room_url: {bot_id, ...}}
+room_to_bots = defaultdict(set)
+
 # Store Daily API helpers
 daily_helpers = {}
 
 
-def cleanup():
-    """Cleanup function to terminate all bot processes.
+async def cleanup():
+    """Cleanup function to cancel all bot tasks.
 
     Called during server shutdown.
     """
-    for entry in bot_procs.values():
-        proc = entry[0]
-        proc.terminate()
-        proc.wait()
+    tasks = [entry[0] for entry in bot_procs.values()]
+    for task in tasks:
+        task.cancel()
+    if not tasks:
+        return
+
+    # Don't let a bot stuck in its own teardown hold up shutdown
+    _, pending = await asyncio.wait(tasks, timeout=BOT_SHUTDOWN_TIMEOUT)
+    if pending:
+        logger.warning("{} bots did not stop within {}s", len(pending), BOT_SHUTDOWN_TIMEOUT)
+
+
+def _on_bot_done(room_url: str, task: asyncio.Task):
+    """Drop a finished bot from room_to_bots and log it if it failed.
+
+    room_url is bound when the bot starts rather than read from bot_procs,
+    which sweep_bots() may already have pruned by the time this runs.
+    """
+    bot_id = id(task)
+    room_to_bots[room_url].discard(bot_id)
+    if not room_to_bots[room_url]:
+        del room_to_bots[room_url]
+
+    if not task.cancelled() and task.exception():
+        logger.opt(exception=task.exception()).error("Bot {} failed", id(task))
+
+
+async def sweep_bots():
+    """Periodically drop finished bots from bot_procs so it doesn't grow forever."""
+    while True:
+        await asyncio.sleep(BOT_SWEEP_INTERVAL)
+        finished = [bot_id for bot_id, entry in bot_procs.items() if entry[0].done()]
+        for bot_id in finished:
+            del bot_procs[bot_id]
+        if finished:
+            logger.debug("Pruned {} finished bots", len(finished))
+
+
+async def run_bot(room_url: str, token: str, **kwargs):
+    """Run bot.main() with its log records tagged with its bot id.
+
+    The id travels in a contextvar, so only records logged from the event
+    loop (the bot task and tasks it starts) are tagged. Records from
+    executor threads, such as VAD analysis, and from daily-python callback
+    threads show bot=-.
+    """
+    with logger.contextualize(bot_id=id(asyncio.current_task())):
+        await bot.main(room_url, token, handle_sigint=False, **kwargs)
+
+
+def start_bot(room_url: str, token: str, **kwargs) -> int:
+    """Start a bot in the given room as a task on the server's event loop.
+
+    Returns:
+        int: The bot id used by the /status endpoint
+    """
+    task = asyncio.create_task(run_bot(room_url, token, **kwargs))
+    task.add_done_callback(functools.partial(_on_bot_done, room_url))
+    bot_id = id(task)
+    bot_procs[bot_id] = (task, room_url)
+    room_to_bots[room_url].add(bot_id)
+    return bot_id
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """FastAPI lifespan manager that handles startup and shutdown tasks.
 
-    - Creates aiohttp session
+    - Creates a pooled aiohttp session shared by all Daily REST calls
     - Initializes Daily API helper
-    - Cleans up resources on shutdown
+    - Starts prewarming the room pool
+    - Loads the shared Silero VAD session so the first call doesn't pay for it
+    - Starts pruning finished bots in the background
+    - Starts polling staff availability for the bots
+    - Deletes unused pooled rooms and cleans up resources on shutdown
     """
-    aiohttp_session = aiohttp.ClientSession()
+    aiohttp_session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=100, ttl_dns_cache=300, keepalive_timeout=75),
+        cookie_jar=aiohttp.DummyCookieJar(),
+    )
     daily_helpers["rest"] = DailyRESTHelper(
         daily_api_key=os.getenv("DAILY_API_KEY", ""),
         daily_api_url=os.getenv("DAILY_API_URL", "https://api.daily.co/v1"),
         aiohttp_session=aiohttp_session,
     )
+    schedule_room_pool_refill()
+    # Initialise ONNX Runtime and read the model file off the event loop
+    await asyncio.to_thread(bot.get_vad_session)
+    sweeper = asyncio.create_task(sweep_bots())
+    bot.start_availability_refresher()
     yield
+    sweeper.cancel()
+    await drain_room_pool()
+    await cleanup()
+    await bot.stop_availability_refresher()
     await aiohttp_session.close()
-    cleanup()
+    await logger.complete()
 
 
-# Initialize FastAPI app with lifespan manager
-app = FastAPI(lifespan=lifespan)
+# Initialize FastAPI app with lifespan manager, serializing responses with orjson
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -92,20 +214,99 @@ app.add_middleware(
 
 
 
-# Add health check routes
+# Add health check route
 @app.get("/health")
 async def health_check():
     """Root health check endpoint."""
     return {"status": "healthy"}
 
-@app.get("/health")
-async def router_health_check():
-    """Router-specific health check endpoint."""
-    return {"status": "healthy"}
+
+async def get_room_token(room_url: str) -> str:
+    """Get an access token for a Daily room, reusing a cached one if still fresh.
+
+    Raises:
+        HTTPException: If token generation fails
+    """
+    entry = _token_cache.get(room_url)
+    if entry and entry[1] > time.time():
+        _token_cache.move_to_end(room_url)
+        return entry[0]
+
+    token = await daily_helpers["rest"].get_token(room_url)
+    if not token:
+        raise HTTPException(status_code=500, detail=f"Failed to get token for room: {room_url}")
+
+    _token_cache[room_url] = (token, time.time() + TOKEN_CACHE_TTL)
+    _token_cache.move_to_end(room_url)
+    if len(_token_cache) > TOKEN_CACHE_MAXLEN:
+        _token_cache.popitem(last=False)
+    return token
+
+
+async def provision_room() -> Tuple[str, str]:
+    """Create a new Daily room and generate an access token for it.
+
+    Raises:
+        HTTPException: If room creation or token generation fails
+    """
+    room = await daily_helpers["rest"].create_room(DailyRoomParams())
+    if not room.url:
+        raise HTTPException(status_code=500, detail="Failed to create room")
+
+    token = await get_room_token(room.url)
+    return room.url, token
+
+
+async def prewarm_rooms(n: int):
+    """Top room_pool up to n rooms, provisioning the missing ones concurrently."""
+    missing = n - room_pool.qsize()
+    results = await asyncio.gather(
+        *(provision_room() for _ in range(missing)), return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, BaseException):
+            logger.error("Failed to prewarm room: {}", result)
+            continue
+        room_url, _ = result
+        room_pool.put_nowait(room_url)
+    logger.debug("Room pool size: {}", room_pool.qsize())
+
+
+def schedule_room_pool_refill():
+    """Start refilling room_pool in the background if it is running low."""
+    global room_pool_refill
+    if ROOM_POOL_SIZE <= 0 or room_pool.qsize() >= ROOM_POOL_REFILL_AT:
+        return
+    if room_pool_refill is None or room_pool_refill.done():
+        room_pool_refill = asyncio.create_task(prewarm_rooms(ROOM_POOL_SIZE))
+
+
+async def drain_room_pool():
+    """Delete the rooms still in room_pool so they don't outlive the server."""
+    # Let a refill in progress finish so the rooms it is creating get deleted too
+    if room_pool_refill and not room_pool_refill.done():
+        await asyncio.wait([room_pool_refill], timeout=ROOM_POOL_SHUTDOWN_TIMEOUT)
+        room_pool_refill.cancel()
+
+    room_urls = []
+    while not room_pool.empty():
+        room_urls.append(room_pool.get_nowait())
+
+    results = await asyncio.gather(
+        *(daily_helpers["rest"].delete_room_by_url(room_url) for room_url in room_urls),
+        return_exceptions=True,
+    )
+    for room_url, result in zip(room_urls, results):
+        if isinstance(result, BaseException):
+            logger.error("Failed to delete pooled room {}: {}", room_url, result)
+    logger.debug("Deleted {} pooled rooms", len(room_urls))
 
 
 async def create_room_and_token() -> Tuple[str, str]:
-    """Helper function to create a Daily room and generate an access token.
+    """Helper function to get a Daily room and an access token.
+
+    Takes a pre-created room from room_pool when one is available, and only
+    creates a room inline when the pool is empty.
 
     Returns:
         tuple[str, str]: A tuple containing (room_url, token)
@@ -114,18 +315,17 @@ async def create_room_and_token() -> Tuple[str, str]:
         HTTPException: If room creation or token generation fails
     """
     start_time = time.time()
-    
-    room = await daily_helpers["rest"].create_room(DailyRoomParams())
-    if not room.url:
-        raise HTTPException(status_code=500, detail="Failed to create room")
 
-    token = await daily_helpers["rest"].get_token(room.url)
-    if not token:
-        raise HTTPException(status_code=500, detail=f"Failed to get token for room: {room.url}")
+    try:
+        room_url = room_pool.get_nowait()
+        token = await get_room_token(room_url)
+    except asyncio.QueueEmpty:
+        room_url, token = await provision_room()
+    schedule_room_pool_refill()
 
     elapsed_time = time.time() - start_time
-    print(f"create_room_and_token latency: {elapsed_time:.2f}s")
-    return room.url, token
+    logger.info("create_room_and_token latency: {:.2f}s", elapsed_time)
+    return room_url, token
 
 
 @app.get("/")
@@ -144,78 +344,58 @@ async def start_agent(request: Request):
     logger.info("Creating room")
     
     room_url, token = await create_room_and_token()
-    logger.info(f"Room URL: {room_url}")
+    logger.info("Room URL: {}", room_url)
 
-    # Check if there is already an existing process running in this room
-    num_bots_in_room = sum(
-        1 for proc in bot_procs.values() if proc[1] == room_url and proc[0].poll() is None
-    )
-    if num_bots_in_room >= MAX_BOTS_PER_ROOM:
-        logger.error(f"Max bot limit reached for room: {room_url}")
+    # Check if there is already an existing bot running in this room
+    if len(room_to_bots.get(room_url, ())) >= MAX_BOTS_PER_ROOM:
+        logger.error("Max bot limit reached for room: {}", room_url)
         raise HTTPException(status_code=500, detail=f"Max bot limit reached for room: {room_url}")
 
-    # Spawn a new bot process
+    # Start a new bot task
     try:
-        proc = subprocess.Popen(
-            [f"python3 -m bot -u {room_url} -t {token}"],
-            shell=True,
-            bufsize=1,
-            cwd=os.path.dirname(os.path.abspath(__file__)),
-        )
-        bot_procs[proc.pid] = (proc, room_url)
-        logger.info(f"Started bot process with PID: {proc.pid}")
+        bot_id = start_bot(room_url, token)
+        logger.info("Started bot with id: {}", bot_id)
     except Exception as e:
-        logger.error(f"Failed to start subprocess: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to start subprocess: {e}")
+        logger.error("Failed to start bot: {}", e)
+        raise HTTPException(status_code=500, detail=f"Failed to start bot: {e}")
 
     elapsed_time = time.time() - start_time
-    logger.info(f"start_agent latency: {elapsed_time:.2f}s")
+    logger.info("start_agent latency: {:.2f}s", elapsed_time)
     return RedirectResponse(room_url)
 
 
 @app.post("/connect")
 async def rtvi_connect(request: Request) -> Dict[Any, Any]:
     # Parse the incoming JSON payload
-    payload = await request.json()
+    payload = orjson.loads(await request.body())
     # Log the full payload to see what's being received
-    logger.info(f"Payload received: {payload}")
-    
+    logger.info("Payload received: {}", payload)
+
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="Request body must be a JSON object")
+
     # Extract custom parameters
     pathname = payload.get("pathname")
     user_id = payload.get("user_id")
     marketing_data = payload.get("marketingData", {})
     
-    logger.info(f"Custom params - pathname: {pathname}, marketing_data: {marketing_data}")
+    logger.info("Custom params - pathname: {}, marketing_data: {}", pathname, marketing_data)
+
+    if not isinstance(marketing_data, dict):
+        raise HTTPException(status_code=400, detail="marketingData must be an object")
 
     # Continue with creating room and token
     room_url, token = await create_room_and_token()
-    
-    # Build command with all parameters
-    cmd_parts = [
-        f"python3 -m bot",
-        f"-u {room_url}",
-        f"-t {token}",
-        f"-p {pathname}" if pathname else "",
-        f"-i {user_id}" if user_id else ""
-    ]
-    
-    # Add marketing data parameters if they exist
-    for key, value in marketing_data.items():
-        if value:
-            cmd_parts.append(f"--{key} {value}")
-    
-    cmd = " ".join(filter(None, cmd_parts))
-    
+
+    # Only pass through marketing data parameters that have a value.
+    # They go to the bot as a single dict so client-supplied keys can never
+    # collide with bot.main() arguments.
+    marketing = {key: value for key, value in marketing_data.items() if value}
+
     try:
-        proc = subprocess.Popen(
-            [cmd],
-            shell=True,
-            bufsize=1,
-            cwd=os.path.dirname(os.path.abspath(__file__)),
-        )
-        bot_procs[proc.pid] = (proc, room_url)
+        start_bot(room_url, token, pathname=pathname, user_id=user_id, marketing=marketing)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to start subprocess: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to start bot: {e}")
 
     return {"room_url": room_url, "token": token}
 
@@ -223,31 +403,31 @@ async def rtvi_connect(request: Request) -> Dict[Any, Any]:
 
 @app.get("/status/{pid}")
 def get_status(pid: int):
-    """Get the status of a specific bot process.
+    """Get the status of a specific bot.
 
     Args:
-        pid (int): Process ID of the bot
+        pid (int): Id of the bot, as returned by POST /
 
     Returns:
-        JSONResponse: Status information for the bot
+        ORJSONResponse: Status information for the bot
 
     Raises:
         HTTPException: If the specified bot process is not found
     """
     start_time = time.time()
     
-    # Look up the subprocess
+    # Look up the bot task
     proc = bot_procs.get(pid)
 
-    # If the subprocess doesn't exist, return an error
+    # If the bot doesn't exist, return an error
     if not proc:
-        raise HTTPException(status_code=404, detail=f"Bot with process id: {pid} not found")
+        raise HTTPException(status_code=404, detail=f"Bot with id: {pid} not found")
 
-    # Check the status of the subprocess
-    status = "running" if proc[0].poll() is None else "finished"
+    # Check the status of the bot task
+    status = "running" if not proc[0].done() else "finished"
     elapsed_time = time.time() - start_time
-    print(f"get_status latency: {elapsed_time:.2f}s")
-    return JSONResponse({"bot_id": pid, "status": status})
+    logger.info("get_status latency: {:.2f}s", elapsed_time)
+    return ORJSONResponse({"bot_id": pid, "status": status})
 
 
 @app.post("/")
@@ -263,42 +443,31 @@ async def join_existing_room(request: Request) -> Dict[Any, Any]:
     start_time = time.time()
     
     # Get room URL from request body
-    body = await request.json()
+    body = orjson.loads(await request.body())
     room_url = body.get('room_url')
     
     if not room_url:
         raise HTTPException(status_code=400, detail="room_url is required")
 
-    # Generate token for the existing room
-    token = await daily_helpers["rest"].get_token(room_url)
-    if not token:
-        raise HTTPException(status_code=500, detail=f"Failed to get token for room: {room_url}")
+    # Get a token for the existing room
+    token = await get_room_token(room_url)
 
     # Check if there is already a bot in this room
-    num_bots_in_room = sum(
-        1 for proc in bot_procs.values() if proc[1] == room_url and proc[0].poll() is None
-    )
-    if num_bots_in_room >= MAX_BOTS_PER_ROOM:
+    if len(room_to_bots.get(room_url, ())) >= MAX_BOTS_PER_ROOM:
         raise HTTPException(status_code=500, detail=f"Max bot limit reached for room: {room_url}")
 
-    # Start the bot process
+    # Start the bot task
     try:
-        proc = subprocess.Popen(
-            [f"python3 -m bot -u {room_url} -t {token}"],
-            shell=True,
-            bufsize=1,
-            cwd=os.path.dirname(os.path.abspath(__file__)),
-        )
-        bot_procs[proc.pid] = (proc, room_url)
+        bot_id = start_bot(room_url, token)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to start subprocess: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to start bot: {e}")
 
     elapsed_time = time.time() - start_time
-    print(f"join_existing_room latency: {elapsed_time:.2f}s")
+    logger.info("join_existing_room latency: {:.2f}s", elapsed_time)
     return {
         "status": "success",
         "room_url": room_url,
-        "bot_pid": proc.pid
+        "bot_pid": bot_id
     }
 
 